@@ -1,25 +1,33 @@
 # app.py — Mini Weather Station (InfluxDB + KPIs + Alertas + Auto-refresh)
-import os, time
+import hashlib, os, re, textwrap, threading
+from concurrent.futures import ThreadPoolExecutor
+import diskcache
 import numpy as np
 import pandas as pd
-import plotly.express as px
+import plotly.graph_objects as go
 import streamlit as st
-from influxdb_client import InfluxDBClient
+import xxhash
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from numba import njit
+from tsdownsample import MinMaxDownsampler, MinMaxLTTBDownsampler
 
 # ---------- Config de página ----------
 st.set_page_config(page_title="Mini Weather Station", page_icon="🌦️", layout="wide")
 
 # ---------- Estilo básico coherente ----------
-st.markdown("""
+@st.cache_data
+def _css():
+    return """
 <style>
 [data-testid="stHeader"] { background: linear-gradient(90deg,#0f172a,#1e293b); }
 h1,h2,h3,h4 { color: #e2e8f0 !important; }
 .block-container { padding-top: 1.5rem; }
-.kpi .big { font-size: 1.8rem; font-weight: 700; }
 .badge{display:inline-block;padding:6px 10px;border-radius:999px;color:white;font-weight:700}
 .badge-ok{background:#16a34a}.badge-warn{background:#f59e0b}.badge-alert{background:#dc2626}
 </style>
-""", unsafe_allow_html=True)
+"""
+
+st.markdown(_css(), unsafe_allow_html=True)
 
 # ---------- Credenciales (hardcoded como en tu código original) ----------
 INFLUXDB_URL    = "https://us-east-1-1.aws.cloud2.influxdata.com"
@@ -27,8 +35,22 @@ INFLUXDB_TOKEN  = "JcKXoXE30JQvV9Ggb4-zv6sQc0Zh6B6Haz5eMRW0FrJEduG2KcFJN9-7RoYvV
 INFLUXDB_ORG    = "0925ccf91ab36478"
 INFLUXDB_BUCKET = "EXTREME_MANUFACTURING"
 
-client = InfluxDBClient(url=INFLUXDB_URL, token=INFLUXDB_TOKEN, org=INFLUXDB_ORG)
-q = client.query_api()
+# Un solo cliente por proceso: reutiliza el pool HTTP/TLS entre recargas
+@st.cache_resource
+def get_query_api():
+    from influxdb_client import InfluxDBClient  # import diferido: acorta el arranque en frío
+    client = InfluxDBClient(url=INFLUXDB_URL, token=INFLUXDB_TOKEN, org=INFLUXDB_ORG, enable_gzip=True)
+    return client.query_api()
+
+# Las consultas son I/O (HTTP): cada refresco las lanza en paralelo en un pool propio,
+# así una respuesta lenta de Influx no frena los paneles de otras sesiones
+def submit(ex, fn, *args, **kwargs):
+    """Ejecuta fn en ex con el contexto de la sesión (session_state, cache_data)."""
+    ctx = get_script_run_ctx()
+    def run():
+        add_script_run_ctx(threading.current_thread(), ctx)
+        return fn(*args, **kwargs)
+    return ex.submit(run)
 
 # ---------- Controles ----------
 st.title("🌦️ Mini Weather Station")
@@ -36,137 +58,371 @@ st.caption("Monitoreo de temperatura, humedad y vibración ligera para espacios
 
 with st.sidebar:
     st.header("⚙️ Controles")
-    rango = st.selectbox("Rango de tiempo", ["30m","1h","6h","12h","24h","7d","15d"], index=3)
-    suav_env = st.selectbox("Suavizado ambiente", ["10s","30s","1m"], index=1)
-    suav_mpu = st.selectbox("Suavizado movimiento", ["100ms","200ms","500ms","1s"], index=1)
-    umbral_hi = st.slider("Alerta: sensación térmica (°C)", 25.0, 40.0, 30.0, 0.5)
-    hum_min   = st.slider("Humedad mínima (%)", 10, 50, 30, 1)
-    hum_max   = st.slider("Humedad máxima (%)", 60, 90, 75, 1)
-    vib_thr   = st.slider("Vibración RMS (m/s²) alerta", 0.5, 3.0, 1.5, 0.1)
-    refresh_s = st.slider("Auto-actualizar cada (s)", 5, 60, 15, 1)
+    rango = st.selectbox("Rango de tiempo", ["30m","1h","6h","12h","24h","7d","15d"], index=3, key="rango")
+    suav_env = st.selectbox("Suavizado ambiente", ["10s","30s","1m"], index=1, key="suav_env")
+    suav_mpu = st.selectbox("Suavizado movimiento", ["100ms","200ms","500ms","1s"], index=1, key="suav_mpu")
+    umbral_hi = st.slider("Alerta: sensación térmica (°C)", 25.0, 40.0, 30.0, 0.5, key="umbral_hi")
+    hum_min   = st.slider("Humedad mínima (%)", 10, 50, 30, 1, key="hum_min")
+    hum_max   = st.slider("Humedad máxima (%)", 60, 90, 75, 1, key="hum_max")
+    vib_thr   = st.slider("Vibración RMS (m/s²) alerta", 0.5, 3.0, 1.5, 0.1, key="vib_thr")
+    refresh_s = st.slider("Auto-actualizar cada (s)", 5, 60, 15, 1, key="refresh_s")
 
 # ---------- Helpers ----------
+_TD_UNITS = {"ms": "milliseconds", "s": "seconds", "m": "minutes", "h": "hours", "d": "days"}
+
+def flux_td(dur: str) -> pd.Timedelta:
+    """Duración Flux ("100ms", "30m", "7d") como Timedelta, sin los alias ambiguos de pandas."""
+    n, unit = re.fullmatch(r"(\d+)(ms|s|m|h|d)", dur).groups()
+    return pd.Timedelta(**{_TD_UNITS[unit]: int(n)})
+
+def fetch_flux(query: str) -> pd.DataFrame:
+    q = get_query_api()
+    # tabla a tabla según llega la respuesta: solo se conservan las 3 columnas útiles
+    chunks = [tbl[["_time","_field","_value"]]
+              for tbl in q.query_data_frame_stream(query, org=INFLUXDB_ORG, data_frame_index=None)
+              if not tbl.empty and "_time" in tbl.columns]
+    if not chunks:
+        return pd.DataFrame(columns=["Tiempo","Variable","Valor"])
+    df = pd.concat(chunks, ignore_index=True)
+    # float32 y milisegundos (UTC sin zona): sobra para DHT22/MPU6050 y Plotly, mitad de memoria
+    t = pd.to_datetime(df["_time"], errors="coerce", utc=True).dt.tz_localize(None).to_numpy(dtype="datetime64[ms]")
+    v = pd.to_numeric(df["_value"], errors="coerce").to_numpy(dtype=np.float32)
+    f = df["_field"].to_numpy()
+    # solo Tiempo/Valor pueden venir vacíos; Influx ya entrega casi ordenado por tiempo
+    mask = ~np.isnat(t) & np.isfinite(v)
+    t, v, f = t[mask], v[mask], f[mask]
+    idx = np.argsort(t, kind="stable")
+    return pd.DataFrame({"Tiempo": t[idx], "Variable": f[idx], "Valor": v[idx]})
+
+# Caché en disco compartida entre sesiones y reinicios del contenedor (una por proceso),
+# en un directorio de la app: diskcache deserializa con pickle lo que encuentre ahí
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".flux_cache")
+
+@st.cache_resource
+def get_cache():
+    return diskcache.Cache(CACHE_DIR, size_limit=2 << 30)
+
 @st.cache_data(ttl=5)
 def query_flux(query: str) -> pd.DataFrame:
-    df = q.query_data_frame(org=INFLUXDB_ORG, query=query)
-    if isinstance(df, list) and len(df): df = pd.concat(df, ignore_index=True)
-    if df is None or df.empty or "_time" not in df.columns:
-        return pd.DataFrame(columns=["Tiempo","Variable","Valor"])
-    df = df[["_time","_field","_value"]].rename(columns={"_time":"Tiempo","_field":"Variable","_value":"Valor"})
-    df["Tiempo"] = pd.to_datetime(df["Tiempo"], errors="coerce")
-    df["Valor"]  = pd.to_numeric(df["Valor"], errors="coerce")
-    return df.dropna().sort_values("Tiempo")
+    return fetch_flux(query)
+
+# Carga en frío del rango completo (memoria + disco); los refrescos solo piden el delta
+@st.cache_data(ttl=5)
+def query_cold(query: str, expire: int = 5) -> pd.DataFrame:
+    key = hashlib.sha1(f"{INFLUXDB_BUCKET}::{query}".encode()).hexdigest()
+    cache = get_cache()
+    hit = cache.get(key)
+    if hit is not None:
+        return hit
+    df = fetch_flux(query)
+    cache.set(key, df, expire=expire)
+    return df
+
+def flux_agg(measurement, fields, start, every):
+    cond = " or ".join(f'r._field == "{f}"' for f in fields)
+    return textwrap.dedent(f'''
+        from(bucket: "{INFLUXDB_BUCKET}")
+          |> range(start: {start})
+          |> filter(fn: (r) => r._measurement == "{measurement}")
+          |> filter(fn: (r) => {cond})
+          |> aggregateWindow(every: {every}, fn: mean, createEmpty: false)
+    ''').strip()
+
+# Vibración en Flux: media de accel_x/y/z por ventana (en storage), pivot de esas medias y
+# a_dyn² = max(|a| - g, 0)² por ventana, igual que el cálculo original en pandas; la RMS
+# móvil se termina en rolling_rms. Usa math.sqrt: la consulta debe empezar con FLUX_IMPORTS
+def flux_vib(measurement, fields, start, every):
+    cond = " or ".join(f'r._field == "{f}"' for f in fields)
+    return textwrap.dedent(f'''
+        from(bucket: "{INFLUXDB_BUCKET}")
+          |> range(start: {start})
+          |> filter(fn: (r) => r._measurement == "{measurement}")
+          |> filter(fn: (r) => {cond})
+          |> aggregateWindow(every: {every}, fn: mean, createEmpty: false)
+          |> pivot(rowKey: ["_time"], columnKey: ["_field"], valueColumn: "_value")
+          |> filter(fn: (r) => exists r.accel_x and exists r.accel_y and exists r.accel_z)
+          |> map(fn: (r) => {{
+              a = math.sqrt(x: r.accel_x*r.accel_x + r.accel_y*r.accel_y + r.accel_z*r.accel_z) - 9.81
+              return {{r with _field: "a_dyn_sq", _value: if a > 0.0 then a*a else 0.0}}
+          }})
+    ''').strip()
+
+FLUX_IMPORTS = 'import "math"'
+
+# RMS móvil en una sola pasada: suma acumulada que entra/sale de la ventana
+@njit(cache=True)
+def rolling_rms(a_dyn_sq: np.ndarray, win: int, min_p: int) -> np.ndarray:
+    n = a_dyn_sq.shape[0]
+    out = np.empty(n, dtype=np.float32)
+    running_sum = 0.0
+    nobs = 0
+    for i in range(n):
+        v = a_dyn_sq[i]
+        if np.isfinite(v):
+            running_sum += v
+            nobs += 1
+        if i >= win:
+            old = a_dyn_sq[i - win]
+            if np.isfinite(old):
+                running_sum -= old
+                nobs -= 1
+        out[i] = np.sqrt(max(running_sum / nobs, 0.0)) if nobs >= min_p else np.nan
+    return out
+
+# Último valor por campo para los KPIs: pocas filas, sin depender del rango elegido
+def flux_last(measurement, fields, start):
+    cond = " or ".join(f'r._field == "{f}"' for f in fields)
+    return textwrap.dedent(f'''
+        from(bucket: "{INFLUXDB_BUCKET}")
+          |> range(start: {start})
+          |> filter(fn: (r) => r._measurement == "{measurement}")
+          |> filter(fn: (r) => {cond})
+          |> last()
+    ''').strip()
+
+DHT_FIELDS = ("temperatura","humedad","sensacion_termica")
+ACC_FIELDS = ("accel_x","accel_y","accel_z")
+
+# Ambiente y movimiento en una sola petición; se separan por Variable (campos disjuntos)
+def flux_all(start_dht, start_mpu, suav_env, suav_mpu):
+    return "\n".join([
+        FLUX_IMPORTS,
+        "dht = " + flux_agg("studio-dht22", DHT_FIELDS, start_dht, suav_env),
+        "mpu = " + flux_vib("mpu6050", ACC_FIELDS, start_mpu, suav_mpu),
+        "union(tables: [dht, mpu])",
+    ])
+
+# Consultas de rango relativo (carga en frío y KPIs): se arman una vez por combinación de
+# parámetros y dan el mismo texto exacto en cada recarga, misma clave para st.cache_data.
+# Los deltas llevan un instante absoluto distinto cada vez y se arman sin caché.
+@st.cache_resource(show_spinner=False)
+def flux_all_cold(window, suav_env, suav_mpu):
+    return flux_all(f"-{window}", f"-{window}", suav_env, suav_mpu)
+
+@st.cache_resource(show_spinner=False)
+def flux_dht_last():
+    return flux_last("studio-dht22", DHT_FIELDS, "-5m")
+
+@st.cache_resource(show_spinner=False)
+def flux_vib_last(suav_mpu):
+    return "\n".join([FLUX_IMPORTS, flux_vib("mpu6050", ACC_FIELDS, "-1m", suav_mpu), "  |> tail(n: 20)"])
+
+def split_groups(df, groups):
+    """Separa el resultado por grupo; cada parte conserva el orden por tiempo."""
+    return {g: df[df["Variable"].isin(variables)].reset_index(drop=True)
+            for g, (variables, _) in groups.items()}
+
+def incremental_query(name, cold, build, window, groups, expire=5):
+    """Guarda un DataFrame por grupo en session_state y en cada refresco trae solo lo nuevo.
+
+    cold es la consulta del rango completo; groups = {grupo: (variables, every)} y
+    build(starts) arma el delta con el inicio de rango de cada grupo. Devuelve {grupo: df}.
+    """
+    key = f"cache::{name}::{window}"
+    # solo se conserva el rango activo: los demás ocuparían memoria de la sesión sin uso
+    for k in [k for k in st.session_state if str(k).startswith("cache::") and k != key]:
+        del st.session_state[k]
+    frames = st.session_state.get(key)
+    if frames is None:
+        frames = split_groups(query_cold(cold, expire), groups)
+    else:
+        starts, bounds = {}, {}
+        for g, (_, every) in groups.items():
+            if frames[g].empty:
+                starts[g] = f"-{window}"
+                continue
+            # _time es el cierre de ventana y la última fila quedó recortada en el now() anterior:
+            # se descarta y se pide de nuevo desde el inicio de esa ventana, sobre la grilla de
+            # aggregateWindow (la fila en bound es la ventana completa anterior y se conserva)
+            bounds[g] = frames[g]["Tiempo"].iloc[-1].floor(flux_td(every))
+            starts[g] = bounds[g].isoformat() + "Z"
+        new = split_groups(fetch_flux(build(starts)), groups)
+        cutoff = pd.Timestamp.now(tz="UTC").tz_localize(None) - flux_td(window)
+        for g, old in frames.items():
+            # old ya está ordenado y todo lo nuevo cae después de bound: basta cortar y pegar
+            if g in bounds:
+                old = old.iloc[:old["Tiempo"].searchsorted(bounds[g], side="right")]
+                df = pd.concat([old, new[g]], ignore_index=True) if not new[g].empty else old
+            else:
+                df = new[g]
+            frames[g] = df.iloc[df["Tiempo"].searchsorted(cutoff, side="left"):] if not df.empty else df
+    st.session_state[key] = frames
+    return frames
+
+def ds(t, v, n=500, minmax=False):
+    """Reduce la serie a ~n puntos para Plotly; MinMax conserva los flancos 0/1."""
+    if len(v) <= n:
+        return t, v
+    algo = MinMaxDownsampler() if minmax else MinMaxLTTBDownsampler()
+    idx = algo.downsample(t.view("int64"), v, n_out=n)
+    return t[idx], v[idx]
+
+def live_fig(name, title, shape="linear", yrange=None):
+    """Figura WebGL creada una vez por sesión; en cada refresco solo cambian x/y."""
+    key = f"fig_{name}"
+    if key not in st.session_state:
+        fig = go.Figure([go.Scattergl(x=[], y=[], mode="lines", line_shape=shape)])
+        fig.update_layout(template="plotly_white", title=title, margin=dict(l=0,r=0,b=0,t=40))
+        if yrange: fig.update_yaxes(range=yrange)
+        st.session_state[key] = fig
+    return st.session_state[key]
+
+def plot_live(name, title, t, v, minmax=False, salt=b"", **fig_kw):
+    """Dibuja la serie; si su firma no cambió se reutiliza la figura tal cual."""
+    fig = live_fig(name, title, **fig_kw)
+    sig = xxhash.xxh64_intdigest(t[:1].tobytes() + t[-1:].tobytes() + v[-1:].tobytes()
+                                 + len(t).to_bytes(8, "little") + salt)
+    if st.session_state.get(f"sig_{name}") != sig:
+        fig.data[0].x, fig.data[0].y = ds(t, v, minmax=minmax)
+        st.session_state[f"sig_{name}"] = sig
+    st.plotly_chart(fig, use_container_width=True)
+
+# Bits de alerta por muestra; una muestra puede acumular varias condiciones
+ALERT_HI, ALERT_HUM_LO, ALERT_HUM_HI, ALERT_VIB = 1, 2, 4, 8
+
+def env_alerts(df_dht, umbral_hi, hum_min, hum_max):
+    """Alertas ambientales de toda la serie en forma ancha (una fila por instante)."""
+    if df_dht.empty:
+        return np.array([], dtype="datetime64[ms]"), np.array([], dtype=np.uint8)
+    wide = df_dht.pivot_table(index="Tiempo", columns="Variable", values="Valor", aggfunc="mean")
+    wide = wide.reindex(columns=list(DHT_FIELDS))
+    hi, hum = wide["sensacion_termica"].to_numpy(), wide["humedad"].to_numpy()
+    alerts = np.zeros(len(wide), dtype=np.uint8)
+    alerts[hi > umbral_hi] |= ALERT_HI
+    alerts[hum < hum_min] |= ALERT_HUM_LO
+    alerts[hum > hum_max] |= ALERT_HUM_HI
+    return wide.index.values, alerts
+
+@st.cache_resource
+def _px():
+    import plotly.express as px  # solo lo usa la gráfica de alertas
+    return px
 
 def badge(text, level):
     cls = {"ok":"badge-ok","warn":"badge-warn","alert":"badge-alert"}.get(level,"badge-warn")
     st.markdown(f'<span class="badge {cls}">{text}</span>', unsafe_allow_html=True)
 
-# ---------- Consultas (usa nombres del profe) ----------
-# Ambiente (DHT22): temperatura, humedad, sensacion_termica
-flux_dht = f'''
-from(bucket: "{INFLUXDB_BUCKET}")
-  |> range(start: -{rango})
-  |> filter(fn: (r) => r._measurement == "studio-dht22")
-  |> filter(fn: (r) => r._field == "temperatura" or r._field == "humedad" or r._field == "sensacion_termica")
-  |> aggregateWindow(every: {suav_env}, fn: mean, createEmpty: false)
-'''
-df_dht = query_flux(flux_dht)
-
-# Movimiento (MPU6050): aceleraciones (para RMS) y/o temperature
-flux_mpu = f'''
-from(bucket: "{INFLUXDB_BUCKET}")
-  |> range(start: -{rango})
-  |> filter(fn: (r) => r._measurement == "mpu6050")
-  |> filter(fn: (r) => r._field == "accel_x" or r._field == "accel_y" or r._field == "accel_z" or
-                         r._field == "temperature")
-  |> aggregateWindow(every: {suav_mpu}, fn: mean, createEmpty: false)
-'''
-df_mpu = query_flux(flux_mpu)
-
-# ---------- KPIs ----------
-st.subheader("Indicadores rápidos")
-k1,k2,k3,k4 = st.columns(4)
-
-temp_now = hum_now = hi_now = np.nan
-if not df_dht.empty:
-    last = df_dht.groupby("Variable").tail(1).set_index("Variable")["Valor"]
-    temp_now = float(last.get("temperatura", np.nan))
-    hum_now  = float(last.get("humedad", np.nan))
-    hi_now   = float(last.get("sensacion_termica", np.nan))
-
-k1.markdown('<div class="kpi"><div>🌡️ Temperatura</div><div class="big">'
-            + (f"{temp_now:.1f} °C" if np.isfinite(temp_now) else "—") + "</div></div>", unsafe_allow_html=True)
-k2.markdown('<div class="kpi"><div>💧 Humedad</div><div class="big">'
-            + (f"{hum_now:.1f} %" if np.isfinite(hum_now) else "—") + "</div></div>", unsafe_allow_html=True)
-
-with k3:
-    if not np.isfinite(hi_now) or not np.isfinite(hum_now):
-        badge("Sin datos", "warn")
-    elif hi_now <= 27 and 30 <= hum_now <= 60:
-        badge("Confortable", "ok")
-    elif hi_now <= umbral_hi and 25 <= hum_now <= 70:
-        badge("Precaución", "warn")
+# ---------- Panel en vivo ----------
+# Solo este bloque se re-ejecuta en cada refresco; barra lateral y CSS quedan fijos
+def render_live():
+    ss = st.session_state
+    rango, suav_env, suav_mpu, refresh_s = ss["rango"], ss["suav_env"], ss["suav_mpu"], ss["refresh_s"]
+    umbral_hi, hum_min, hum_max, vib_thr = ss["umbral_hi"], ss["hum_min"], ss["hum_max"], ss["vib_thr"]
+
+    # ---------- Consultas (usa nombres del profe) ----------
+    # Ambiente (DHT22): temperatura, humedad, sensacion_termica
+    # Movimiento (MPU6050): a_dyn² medio por ventana de suavizado, calculado en Flux
+    groups = {"dht": (DHT_FIELDS, suav_env), "mpu": (("a_dyn_sq",), suav_mpu)}
+    with ThreadPoolExecutor(max_workers=3) as ex:
+        f_all = submit(ex, incremental_query, f"all::{suav_env}::{suav_mpu}",
+                       flux_all_cold(rango, suav_env, suav_mpu),
+                       lambda starts: flux_all(starts["dht"], starts["mpu"], suav_env, suav_mpu),
+                       rango, groups, refresh_s)
+        f_last = submit(ex, query_flux, flux_dht_last())
+        f_vib_last = submit(ex, query_flux, flux_vib_last(suav_mpu))
+        frames, df_last, df_vib_last = (f.result() for f in (f_all, f_last, f_vib_last))
+    df_dht, df_mpu = frames["dht"], frames["mpu"]
+
+    # ---------- KPIs ----------
+    st.subheader("Indicadores rápidos")
+    k1,k2,k3,k4 = st.columns(4)
+
+    temp_now = hum_now = hi_now = np.nan
+    if not df_last.empty:
+        # filas ya ordenadas por tiempo: se recorre desde el final hasta tener cada campo
+        last = {}
+        for var, val in zip(df_last["Variable"].to_numpy()[::-1], df_last["Valor"].to_numpy()[::-1]):
+            if var not in last:
+                last[var] = val
+                if len(last) == len(DHT_FIELDS): break
+        temp_now = float(last.get("temperatura", np.nan))
+        hum_now  = float(last.get("humedad", np.nan))
+        hi_now   = float(last.get("sensacion_termica", np.nan))
+
+    k1.metric("🌡️ Temperatura", f"{temp_now:.1f} °C" if np.isfinite(temp_now) else "—")
+    k2.metric("💧 Humedad", f"{hum_now:.1f} %" if np.isfinite(hum_now) else "—")
+
+    with k3:
+        if not np.isfinite(hi_now) or not np.isfinite(hum_now):
+            badge("Sin datos", "warn")
+        elif hi_now <= 27 and 30 <= hum_now <= 60:
+            badge("Confortable", "ok")
+        elif hi_now <= umbral_hi and 25 <= hum_now <= 70:
+            badge("Precaución", "warn")
+        else:
+            badge("Alerta térmica", "alert")
+
+    # Movimiento actual: RMS de las últimas 20 ventanas del último minuto
+    vib_rms_now = np.nan
+    mov_flag_now = 0  # 0: normal, 1: movimiento
+    if not df_vib_last.empty:
+        vib_rms_now = float(rolling_rms(df_vib_last["Valor"].to_numpy(), 20, 5)[-1])
+        mov_flag_now = int(vib_rms_now > vib_thr)
+
+    # ---------- Gráficas: Temperatura / Humedad ----------
+    st.subheader("Ambiente")
+    if df_dht.empty:
+        st.info("No hay datos de DHT22 en el rango.")
+    else:
+        for var, titulo in [
+            ("temperatura", "Temperatura (°C)"),
+            ("humedad", "Humedad (%)"),
+        ]:
+            sub = df_dht[df_dht["Variable"]==var]
+            if not sub.empty:
+                plot_live(var, titulo, sub["Tiempo"].values, sub["Valor"].to_numpy())
+
+    # ---------- Vibración: vib_rms + bandera de movimiento ----------
+    st.subheader("Movimiento / Vibración")
+    if np.isfinite(vib_rms_now):
+        badge(f"Movimiento · {vib_rms_now:.2f} m/s²" if mov_flag_now else f"Quieto · {vib_rms_now:.2f} m/s²",
+              "alert" if mov_flag_now else "ok")
+    t_mpu = np.array([], dtype="datetime64[ms]")
+    vib_rms = np.array([], dtype=np.float32)
+    if df_mpu.empty:
+        st.info("No hay aceleraciones (accel_x/y/z) en el rango seleccionado.")
     else:
-        badge("Alerta térmica", "alert")
-
-# Movimiento actual (lo calculamos más abajo y lo mostramos aquí)
-vib_rms_now = np.nan
-mov_flag_now = 0  # 0: normal, 1: movimiento
-
-# ---------- Gráficas: Temperatura / Humedad ----------
-st.subheader("Ambiente")
-if df_dht.empty:
-    st.info("No hay datos de DHT22 en el rango.")
-else:
-    for var, titulo in [
-        ("temperatura", "Temperatura (°C)"),
-        ("humedad", "Humedad (%)"),
-    ]:
-        sub = df_dht[df_dht["Variable"]==var]
-        if not sub.empty:
-            fig = px.line(sub, x="Tiempo", y="Valor", title=titulo, template="plotly_white")
-            fig.update_layout(margin=dict(l=0,r=0,b=0,t=40))
-            st.plotly_chart(fig, use_container_width=True)
-
-# ---------- Vibración: vib_rms + bandera de movimiento ----------
-st.subheader("Movimiento / Vibración")
-if df_mpu.empty or not any(df_mpu["Variable"].isin(["accel_x","accel_y","accel_z"])):
-    st.info("No hay aceleraciones (accel_x/y/z) en el rango seleccionado.")
-else:
-    acc = df_mpu[df_mpu["Variable"].isin(["accel_x","accel_y","accel_z"])]
-    piv = acc.pivot(index="Tiempo", columns="Variable", values="Valor").dropna()
-    a_mag = np.sqrt((piv**2).sum(axis=1))          # magnitud total
-    a_dyn = np.maximum(a_mag - 9.81, 0)            # quitar gravedad (aprox)
-    vib_rms = (a_dyn**2).rolling(20, min_periods=5).mean()**0.5
-    vib_df = vib_rms.rename("vib_rms").reset_index()
-
-    # bandera binaria de movimiento para la mini estación
-    mov_flag = (vib_rms > vib_thr).astype(int).rename("movimiento")
-    mov_df = mov_flag.reset_index()
-
-    if not vib_df.empty:
-        vib_rms_now = float(vib_df["vib_rms"].iloc[-1])
-        mov_flag_now = int(mov_df["movimiento"].iloc[-1])
-        # Gráfica vib_rms
-        fig_v = px.line(vib_df, x="Tiempo", y="vib_rms", title="Vibración RMS (m/s²)", template="plotly_white")
-        fig_v.update_layout(margin=dict(l=0,r=0,b=0,t=40))
-        st.plotly_chart(fig_v, use_container_width=True)
-        # Gráfica bandera movimiento (0/1)
-        fig_m = px.step(mov_df, x="Tiempo", y="movimiento", title="Movimiento detectado (0 = normal, 1 = movimiento)",
-                        template="plotly_white")
-        fig_m.update_yaxes(range=[-0.1, 1.1])
-        fig_m.update_layout(margin=dict(l=0,r=0,b=0,t=40))
-        st.plotly_chart(fig_m, use_container_width=True)
-
-# ---------- Alertas ----------
-if np.isfinite(hi_now) and hi_now > umbral_hi:
-    st.warning("🌡️ Alta sensación térmica. Ventila o hidrátate.")
-if np.isfinite(hum_now) and (hum_now < hum_min or hum_now > hum_max):
-    st.warning("💧 Humedad fuera de rango (ideal 30–60%).")
-if np.isfinite(vib_rms_now) and vib_rms_now > vib_thr:
-    st.error("🟣 Vibración elevada — posible golpe/actividad en la superficie.")
-
-# ---------- Pie y auto-refresh ----------
+        a_dyn_sq = np.ascontiguousarray(df_mpu["Valor"].to_numpy())
+        t_mpu = df_mpu["Tiempo"].values
+        vib_rms = rolling_rms(a_dyn_sq, 20, 5)
+
+        # bandera binaria de movimiento para la mini estación
+        mov_flag = (vib_rms > vib_thr).astype(np.int8)
+
+        if len(vib_rms):
+            ok = np.isfinite(vib_rms)
+            # Gráfica vib_rms
+            plot_live("vib_rms", "Vibración RMS (m/s²)", t_mpu[ok], vib_rms[ok])
+            # Gráfica bandera movimiento (0/1); el umbral entra en la firma
+            plot_live("movimiento", "Movimiento detectado (0 = normal, 1 = movimiento)", t_mpu, mov_flag,
+                      minmax=True, salt=np.float32(vib_thr).tobytes(), shape="hv", yrange=[-0.1, 1.1])
+
+    # ---------- Alertas ----------
+    # una máscara por instante DHT: cada muestra de vibración sobre el umbral marca la ventana
+    # DHT que la contiene (primer cierre >= su _time), así el conteo no depende de suav_mpu
+    t_env, alerts = env_alerts(df_dht, umbral_hi, hum_min, hum_max)
+    if len(t_env) and len(vib_rms):
+        idx = np.searchsorted(t_env, t_mpu[vib_rms > vib_thr], side="left")
+        alerts[idx[idx < len(t_env)]] |= ALERT_VIB
+    k4.metric("🚨 Alertas (rango)", int(np.count_nonzero(alerts)))
+
+    ev = t_env[alerts != 0].astype("datetime64[h]")
+    if len(ev):
+        h0 = ev.min()
+        counts = np.bincount((ev - h0).astype(int))
+        fig_a = _px().bar(x=h0 + np.arange(len(counts)), y=counts, title="Alertas por hora",
+                       labels={"x": "Hora", "y": "Eventos"}, template="plotly_white")
+        fig_a.update_layout(margin=dict(l=0,r=0,b=0,t=40))
+        st.plotly_chart(fig_a, use_container_width=True)
+
+    if np.isfinite(hi_now) and hi_now > umbral_hi:
+        st.warning("🌡️ Alta sensación térmica. Ventila o hidrátate.")
+    if np.isfinite(hum_now) and (hum_now < hum_min or hum_now > hum_max):
+        st.warning("💧 Humedad fuera de rango (ideal 30–60%).")
+    if mov_flag_now:
+        st.error("🟣 Vibración elevada — posible golpe/actividad en la superficie.")
+
+st.fragment(run_every=refresh_s)(render_live)()
+
+# ---------- Pie ----------
 st.caption(f"Bucket: {INFLUXDB_BUCKET} · Org: {INFLUXDB_ORG} · Rango: {rango} · Refresco: {refresh_s}s")
-time.sleep(refresh_s)
-st.experimental_rerun()